@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 
+import io
 import os
 import random
 import argparse
+import itertools
+import numpy as np
 from enum import Enum
 from pathlib import Path
-from functools import cmp_to_key
 from pgmpy.readwrite import BIFReader
-from typing import Dict, List, Set, Union
+from typing import Dict, List, Sequence, Set, Tuple, Union
 
 
 class SelectorVariableTypeEnum(Enum):
@@ -22,7 +24,6 @@ class CircuitTypeEnum(Enum):
     sdDNNF = 3
 
 
-TMP_FILE_PATH: str = "tmp.txt"
 circuit_type_enum_names = [ct.name for ct in CircuitTypeEnum]
 selector_variable_type_enum_names = [svt.name for svt in SelectorVariableTypeEnum]
 
@@ -62,10 +63,10 @@ def input_file_path_parser(path: str) -> str:
 
 def output_file_path_parser(path: str) -> str:
     """
-    Try to create an empty output file
+    Check if the output file does not exist and can be created (the file itself is not created)
     :param path: the path of the output file
     :return: the path
-    :raises ArgumentTypeError: if the output file creation fails or the output file already exists
+    :raises ArgumentTypeError: if the output file already exists or cannot be created
     """
 
     path_tmp = Path(path)
@@ -74,18 +75,17 @@ def output_file_path_parser(path: str) -> str:
     if path_tmp.exists():
         raise argparse.ArgumentTypeError(f"The output file ({path}) already exists. Please delete it or choose another name for the output file!")
 
-    try:
-        with open(path_tmp, "w", encoding="utf-8") as _:
-            pass
-    except Exception as err:
-        raise argparse.ArgumentTypeError(f"An error occurred while creating the output file ({path})! ({str(err)})")
+    directory_tmp = path_tmp.parent
 
-    # Check if the output file has been created
-    if path_tmp.exists():
-        path_tmp.unlink()
-        return path
+    # The directory of the output file does not exist
+    if not directory_tmp.is_dir():
+        raise argparse.ArgumentTypeError(f"The directory of the output file ({path}) doesn't exist!")
 
-    raise argparse.ArgumentTypeError(f"An error occurred while creating the output file ({path})!")
+    # The directory of the output file is not writable
+    if not os.access(directory_tmp, os.W_OK):
+        raise argparse.ArgumentTypeError(f"The output file ({path}) cannot be created, since its directory is not writable!")
+
+    return path
 
 
 def seed_parser(value: Union[int, str]) -> int:
@@ -181,7 +181,18 @@ number_of_zeros: int = 0
 number_of_shrinks: int = 0
 number_of_independent_variables: int = 0
 
-saved_clauses: Set[str] = set()
+# The current CPT (the variables are identified by their positions in the CPT)
+cpt_cardinalities: List[int] = []
+cpt_variable_indices: List[List[str]] = []
+probability_table: np.ndarray = np.empty(0)
+probability_strides: List[int] = []
+
+saved_clauses: Set[Tuple[int, ...]] = set()
+independence_cache: Dict[Tuple[int, int, float], bool] = dict()
+independence_recursion_cache: Dict[Tuple[int, Tuple[int, ...], int, float], bool] = dict()
+
+# The selector variable for hard clauses + " 0" (None if a new selector variable is used for each hard clause)
+hard_clause_suffix: Union[str, None] = None
 
 """
 Parameters
@@ -194,21 +205,6 @@ constraint_clauses_for_leaf_variables: bool = False
 selector_variable_type: SelectorVariableTypeEnum = SelectorVariableTypeEnum.NONE
 
 
-def get_name_for_mapping(variable_arg: str, state_arg: str) -> str:
-    assert variable_arg in variables_bayesian_network
-    assert state_arg in states_bayesian_network[variable_arg]
-
-    return variable_arg + "_____" + state_arg
-
-
-def get_variable_for_name(variable_arg: str, state_arg: str) -> str:
-    name_tmp: str = get_name_for_mapping(variable_arg, state_arg)
-
-    assert name_tmp in mapping_from_variable_state_to_variable_index
-
-    return mapping_from_variable_state_to_variable_index[name_tmp]
-
-
 def get_new_variable_index() -> int:
     """
     :return: a new variable index
@@ -238,120 +234,106 @@ def get_selector_variable_for_hard_clauses():
         raise Exception("Not implemented!")
 
 
-def create_core_clause(index_states_arg: List[int], variables_arg: List[str], ignored_variables_arg: Set[str] = None) -> str:
+def create_core_clause(index_states_arg: Sequence[int], ignored_variables_arg: Set[int] = None) -> str:
     """
-    It creates a core clause for the CPT line defined by the arguments.
+    It creates a core clause for the CPT line (of the current CPT) defined by the arguments.
     :param index_states_arg: represents the current state for each variable
-    :param variables_arg: a list of variables
-    :param ignored_variables_arg: a set of ignored variables
+    :param ignored_variables_arg: a set of ignored variables (their positions in the CPT)
     :return: a core clause
     """
     # No ignored variables
     if ignored_variables_arg is None:
         ignored_variables_arg = set()
 
-    assert len(index_states_arg) == len(variables_arg)
-    assert len(ignored_variables_arg) < len(variables_arg)
-
-    for var_tmp in ignored_variables_arg:
-        assert var_tmp in variables_arg
-
-    for k, var_tmp in enumerate(variables_arg):
-        assert index_states_arg[k] < len(states_bayesian_network[var_tmp])
-
     list_tmp: List[str] = []
 
-    for k, var_tmp in enumerate(variables_arg):
+    for k, variable_indices in enumerate(cpt_variable_indices):
         # Ignored variable
-        if var_tmp in ignored_variables_arg:
+        if k in ignored_variables_arg:
             continue
 
-        state_tmp = states_bayesian_network[var_tmp][index_states_arg[k]]
-
-        list_tmp.append("-" + get_variable_for_name(var_tmp, state_tmp))
+        list_tmp.append("-" + variable_indices[index_states_arg[k]])
 
     assert list_tmp
 
-    list_tmp = sorted(list_tmp)
+    return " ".join(sorted(list_tmp))
 
-    core_clause = ""
-    for x in list_tmp:
-        core_clause = core_clause + (" " if core_clause else "") + x
 
-    return core_clause
+def create_probability_key(index_states_arg: Sequence[int]) -> int:
+    """
+    It creates a key (the position in the probability table) for the CPT line (of the current CPT) defined by the arguments.
+    The probability table is created for each CPT, so the variables are always in the same order, and thus the index states identify the CPT line.
+    :param index_states_arg: represents the current state for each variable
+    :return: a key (the dot product of the index states and the strides)
+    """
+    return sum(index_state * stride for index_state, stride in zip(index_states_arg, probability_strides))
 
 
-def is_variable_independent(var_index_arg: int, index_states_arg: List[int], variables_arg: List[str], probability_arg: float) -> bool:
-    assert var_index_arg < len(variables_arg)
-    assert len(index_states_arg) == len(variables_arg)
+def is_variable_independent(var_index_arg: int, index_states_arg: Sequence[int], probability_arg: float, key_arg: int) -> bool:
+    """
+    The CPT lines that differ only in the state of the variable are accessed directly by adding multiples of the stride of the variable to the key.
+    The result is cached in the independence cache (the cache is cleared for each CPT).
+    :param key_arg: the key of the current CPT line (it can differ from the key of the index states except for the variable)
+    """
+    stride = probability_strides[var_index_arg]
+    base_key = key_arg - index_states_arg[var_index_arg] * stride
 
-    index_states_tmp = index_states_arg.copy()
+    cache_key = (var_index_arg, base_key, probability_arg)
 
-    for k, _ in enumerate(states_bayesian_network[variables_arg[var_index_arg]]):
-        index_states_tmp[var_index_arg] = k
+    if cache_key in independence_cache:
+        return independence_cache[cache_key]
 
-        key = create_core_clause(index_states_tmp, variables_arg)
+    independent = True
 
-        assert key in probability_dictionary
+    for k in range(cpt_cardinalities[var_index_arg]):
+        if probability_arg != probability_table[base_key + k * stride]:
+            independent = False
+            break
 
-        if probability_arg != probability_dictionary[key]:
-            return False
+    independence_cache[cache_key] = independent
 
-    return True
+    return independent
 
 
 def is_variable_independent_recursion(var_index_arg: int, independent_variable_index_list_arg: List[int],
-                                      index_states_arg: List[int], variables_arg: List[str], n_arg: int, probability_arg: float) -> bool:
-    assert var_index_arg < len(variables_arg)
-    assert len(index_states_arg) == len(variables_arg)
-    assert n_arg <= len(independent_variable_index_list_arg)
-    assert var_index_arg not in independent_variable_index_list_arg
-
+                                      index_states_arg: Sequence[int], n_arg: int, probability_arg: float, key_arg: int) -> bool:
+    """
+    :param key_arg: the key of the current CPT line (the states of the first n_arg independent variables can differ from the index states)
+    """
     if n_arg == len(independent_variable_index_list_arg):
-        return is_variable_independent(var_index_arg, index_states_arg, variables_arg, probability_arg)
+        return is_variable_independent(var_index_arg, index_states_arg, probability_arg, key_arg)
     else:
-        assert independent_variable_index_list_arg[n_arg] < len(variables_arg)
-
-        index_states_tmp = index_states_arg.copy()
         var_index = independent_variable_index_list_arg[n_arg]
+        stride = probability_strides[var_index]
+        base_key = key_arg - index_states_arg[var_index] * stride
 
-        for k, _ in enumerate(states_bayesian_network[variables_arg[var_index]]):
-            index_states_tmp[var_index] = k
-
-            if not is_variable_independent_recursion(var_index_arg, independent_variable_index_list_arg, index_states_tmp, variables_arg,
-                                                     n_arg + 1, probability_arg):
+        for k in range(cpt_cardinalities[var_index]):
+            if not is_variable_independent_recursion(var_index_arg, independent_variable_index_list_arg, index_states_arg,
+                                                     n_arg + 1, probability_arg, base_key + k * stride):
                 return False
 
         return True
 
 
-def get_independent_variables(index_states_arg: List[int], variables_arg: List[str], probability_arg: float) -> Set[str]:
-    assert len(index_states_arg) == len(variables_arg)
-
+def get_independent_variables(index_states_arg: Sequence[int], probability_arg: float, key_arg: int) -> Set[int]:
+    """
+    :param key_arg: the key of the CPT line defined by the index states
+    :return: a set of independent variables (their positions in the CPT)
+    """
     independent_variable_index_list: List[int] = []
 
-    for k, _ in enumerate(variables_arg):
-        if is_variable_independent(k, index_states_arg, variables_arg, probability_arg):
+    for k in range(len(cpt_cardinalities)):
+        if is_variable_independent(k, index_states_arg, probability_arg, key_arg):
             independent_variable_index_list.append(k)
 
-    def compare(index_1: int, index_2: int) -> int:
-        number_of_states_1 = len(states_bayesian_network[variables_arg[index_1]])
-        number_of_states_2 = len(states_bayesian_network[variables_arg[index_2]])
-
-        if number_of_states_1 < number_of_states_2:
-            return 1
-        elif number_of_states_1 > number_of_states_2:
-            return -1
-        else:
-            return variables_arg[index_1] < variables_arg[index_2]
-
-    independent_variable_index_list = sorted(independent_variable_index_list, key=cmp_to_key(compare))
+    # The variables with more states first (the sort is stable, so variables with the same number of states keep their order)
+    independent_variable_index_list = sorted(independent_variable_index_list, key=lambda index: -cpt_cardinalities[index])
 
     if not independent_variable_index_list:
         return set()
 
     if len(independent_variable_index_list) == 1:
-        return {variables_arg[independent_variable_index_list[0]]}
+        return {independent_variable_index_list[0]}
 
     valid_independent_variable_index_list: List[int] = [independent_variable_index_list[0]]
 
@@ -359,14 +341,22 @@ def get_independent_variables(index_states_arg: List[int], variables_arg: List[s
         if k == 0:
             continue
 
-        if is_variable_independent_recursion(var_index, valid_independent_variable_index_list, index_states_arg, variables_arg, 0, probability_arg):
-            valid_independent_variable_index_list.append(var_index)
+        # The result depends only on the CPT lines that differ from the current one in the states of the (valid) independent variables,
+        # so it is shared by all these CPT lines
+        base_key = key_arg - index_states_arg[var_index] * probability_strides[var_index]
+        for valid_var_index in valid_independent_variable_index_list:
+            base_key -= index_states_arg[valid_var_index] * probability_strides[valid_var_index]
+
+        cache_key = (var_index, tuple(valid_independent_variable_index_list), base_key, probability_arg)
 
-    independent_variables: Set[str] = set()
-    for var_index in valid_independent_variable_index_list:
-        independent_variables.add(variables_arg[var_index])
+        if cache_key not in independence_recursion_cache:
+            independence_recursion_cache[cache_key] = is_variable_independent_recursion(var_index, valid_independent_variable_index_list, index_states_arg,
+                                                                                        0, probability_arg, key_arg)
+
+        if independence_recursion_cache[cache_key]:
+            valid_independent_variable_index_list.append(var_index)
 
-    return independent_variables
+    return set(valid_independent_variable_index_list)
 
 
 def create_minor_clauses(core_clause: str, parameter_variable: int) -> str:
@@ -383,155 +373,183 @@ def create_minor_clauses(core_clause: str, parameter_variable: int) -> str:
     minor_clauses_string: str = ""
 
     for k in range(len(core_clause_list)):
-        assert core_clause_list[k][0] == "-"
         variable_tmp = core_clause_list[k][1:]
         minor_clauses_string += variable_tmp + " -" + str(parameter_variable) + " 0\n"
 
-        number_of_clauses += 1
+    number_of_clauses += len(core_clause_list)
 
     return minor_clauses_string
 
 
-def create_parameter_clauses(index_states_arg: List[int], variables_arg: List[str], n_arg: int):
+def create_parameter_clauses(variables_arg: List[str]):
+    """
+    Creates the parameter clauses for all CPT lines of the CPT defined by the variables
+    :param variables_arg: the parents followed by the variable of the CPT
+    """
     global number_of_ones
     global number_of_zeros
     global number_of_clauses
     global number_of_shrinks
     global number_of_independent_variables
 
-    assert n_arg < len(variables_arg)
+    assert len(variables_arg) == len(cpt_cardinalities)
 
-    states = states_bayesian_network[variables_arg[n_arg]]
+    # The counters are updated locally and added to the global ones at the end
+    number_of_ones_tmp: int = 0
+    number_of_zeros_tmp: int = 0
+    number_of_clauses_tmp: int = 0
+    number_of_shrinks_tmp: int = 0
+    number_of_independent_variables_tmp: int = 0
 
-    if n_arg == (len(variables_arg) - 1):
-        for k, _ in enumerate(states):
-            index_states_tmp = index_states_arg.copy()
-            index_states_tmp.append(k)
+    # The CPT lines are enumerated in C order, so the position of a CPT line is its key (see create_probability_table)
+    for key, index_states_tmp in enumerate(itertools.product(*[range(cardinality) for cardinality in cpt_cardinalities])):
+        probability = probability_table[key]
 
-            assert len(index_states_tmp) == len(variables_arg)
+        if determinism and probability == 1:
+            number_of_ones_tmp += 1
+            continue
 
-            core_clause = create_core_clause(index_states_tmp, variables_arg)
+        # Context-specific independence
+        if context_specific_independence:
+            independent_variables: Set[int] = get_independent_variables(index_states_tmp, probability, key)
+        else:
+            independent_variables: Set[int] = set()
 
-            assert core_clause in probability_dictionary
+        # if independent_variables:
+        #     for m, var_tmp in enumerate(variables_arg):
+        #         print(var_tmp + " (" + states_bayesian_network[var_tmp][index_states_tmp[m]] + ")", end=" ")
+        #     print("- " + str({variables_arg[m] for m in independent_variables}))
 
-            probability = probability_dictionary[core_clause]
+        if len(variables_arg) == 1:
+            independent_variables = set()
 
-            if determinism and probability == 1:
-                number_of_ones += 1
-                continue
+        if len(variables_arg) == len(independent_variables):
+            assert (len(variables_arg) - 1) in independent_variables
+            independent_variables.remove(len(variables_arg) - 1)
 
-            # Context-specific independence
-            if context_specific_independence:
-                independent_variables: Set[str] = get_independent_variables(index_states_tmp, variables_arg, probability)
-            else:
-                independent_variables: Set[str] = set()
+        assert len(variables_arg) > len(independent_variables)
 
-            # if independent_variables:
-            #     for m, var_tmp in enumerate(variables_arg):
-            #         print(var_tmp + " (" + states_bayesian_network[var_tmp][index_states_tmp[m]] + ")", end=" ")
-            #     print("- " + str(independent_variables))
+        parameter_variable: int = 0
+        is_zero_prob_determinism = (determinism and probability == 0)
 
-            if len(variables_arg) == 1:
-                independent_variables = set()
+        # The clauses are written at once
+        clause_parts: List[str] = []
 
-            if len(variables_arg) == len(independent_variables):
-                assert variables_arg[-1] in independent_variables
-                independent_variables.remove(variables_arg[-1])
+        if not independent_variables:
+            if model_competition and not is_zero_prob_determinism:
+                parameter_variable = get_new_variable_index()
+                clause_parts.append(f"c p weight {parameter_variable} {probability:.3f} 0\nc p weight -{parameter_variable} 1 0\n")
+            else:
+                clause_parts.append("c " + str(probability) + "\n")
 
-            assert len(variables_arg) > len(independent_variables)
+            core_clause = create_core_clause(index_states_tmp)
+            clause_parts.append(core_clause)
+        else:
+            number_of_shrinks_tmp += 1
+            number_of_independent_variables_tmp += len(independent_variables)
 
-            parameter_variable: int = 0
-            is_zero_prob_determinism = (determinism and probability == 0)
+            # The reduced core clause is identified by the index states where the independent variables are ignored (-1)
+            saved_clause_key = tuple(-1 if k in independent_variables else index_state for k, index_state in enumerate(index_states_tmp))
 
-            if not independent_variables:
-                if model_competition and not is_zero_prob_determinism:
-                    parameter_variable = get_new_variable_index()
-                    tmp_file.write(f"c p weight {parameter_variable} {probability:.3f} 0\n")
-                    tmp_file.write(f"c p weight -{parameter_variable} 1 0\n")
-                else:
-                    tmp_file.write("c " + str(probability) + "\n")
+            if saved_clause_key in saved_clauses:
+                continue
 
-                tmp_file.write(core_clause)
-            else:
-                number_of_shrinks += 1
-                number_of_independent_variables += len(independent_variables)
+            saved_clauses.add(saved_clause_key)
 
-                core_clause_reduced = create_core_clause(index_states_tmp, variables_arg, independent_variables)
+            core_clause_reduced = create_core_clause(index_states_tmp, independent_variables)
 
-                if core_clause_reduced in saved_clauses:
-                    continue
+            if model_competition and not is_zero_prob_determinism:
+                parameter_variable = get_new_variable_index()
+                clause_parts.append(f"c p weight {parameter_variable} {probability:.3f} 0\nc p weight -{parameter_variable} 1 0\n")
+            else:
+                clause_parts.append("c " + str(probability) + "\n")
 
-                saved_clauses.add(core_clause_reduced)
+            clause_parts.append(core_clause_reduced)
 
-                if model_competition and not is_zero_prob_determinism:
-                    parameter_variable = get_new_variable_index()
-                    tmp_file.write(f"c p weight {parameter_variable} {probability:.3f} 0\n")
-                    tmp_file.write(f"c p weight -{parameter_variable} 1 0\n")
-                else:
-                    tmp_file.write("c " + str(probability) + "\n")
+            core_clause = core_clause_reduced
 
-                tmp_file.write(core_clause_reduced)
+        if determinism and probability == 0:
+            number_of_zeros_tmp += 1
+            clause_parts.append(hard_clause_suffix or get_selector_variable_for_hard_clauses())
+        else:
+            if parameter_variable == 0:
+                parameter_variable = get_new_variable_index()
+            clause_parts.append(" " + str(parameter_variable) + " 0\n")
 
-                core_clause = core_clause_reduced
+        number_of_clauses_tmp += 1
 
-            if determinism and probability == 0:
-                number_of_zeros += 1
-                tmp_file.write(get_selector_variable_for_hard_clauses())
-            else:
-                if parameter_variable == 0:
-                    parameter_variable = get_new_variable_index()
-                tmp_file.write(" " + str(parameter_variable) + " 0\n")
+        # Minor clauses
+        if add_minor_clauses:
+            assert (parameter_variable != 0)
 
-            number_of_clauses += 1
+            clause_parts.append(create_minor_clauses(core_clause, parameter_variable))
 
-            # Minor clauses
-            if add_minor_clauses:
-                assert (parameter_variable != 0)
+        clause_buffer.write("".join(clause_parts))
 
-                tmp_file.write(create_minor_clauses(core_clause, parameter_variable))
-    else:
-        for k, _ in enumerate(states):
-            index_states_tmp = index_states_arg.copy()
-            index_states_tmp.append(k)
+    number_of_ones += number_of_ones_tmp
+    number_of_zeros += number_of_zeros_tmp
+    number_of_clauses += number_of_clauses_tmp
+    number_of_shrinks += number_of_shrinks_tmp
+    number_of_independent_variables += number_of_independent_variables_tmp
 
-            create_parameter_clauses(index_states_tmp, variables_arg, n_arg + 1)
 
+def create_probability_table(variables_arg: List[str]) -> None:
+    """
+    It creates the probability table (and the strides of the keys) for the CPT defined by the variables.
+    It also sets the number of states and the variable indices of the states of each variable of the CPT,
+    so the CPT lines are processed using the positions of the variables instead of their names.
+    The CPT is traversed at once using NumPy instead of recursively.
+    :param variables_arg: the parents followed by the variable of the CPT
+    """
+    global probability_table
+    global probability_strides
+    global cpt_cardinalities
+    global cpt_variable_indices
 
-def create_probability_dictionary(string_list_arg, variables_arg, n_arg, number_arg, dimension_arg):
-    global probability_dictionary
+    assert len(variables_arg) > 0
 
-    assert n_arg < len(variables_arg)
+    var_tmp = variables_arg[-1]
+    cardinalities: List[int] = [len(states_bayesian_network[v]) for v in variables_arg]
 
-    var_tmp = variables_arg[n_arg]
-    states = states_bayesian_network[var_tmp]
+    cpt_cardinalities = cardinalities
+    cpt_variable_indices = [mapping_from_variable_to_variable_indices[v] for v in variables_arg]
 
-    if n_arg == (len(variables_arg) - 1):
-        for k, state_tmp in enumerate(states):
-            probability = values_bayesian_network[var_tmp][k][number_arg]
+    # The columns of the CPT are ordered by the states of the parents (the first parent is the most significant one)
+    cpt = np.asarray(values_bayesian_network[var_tmp], dtype=np.float64).reshape([cardinalities[-1]] + cardinalities[:-1])
+    cpt = np.moveaxis(cpt, 0, -1)
 
-            string_list_tmp = string_list_arg.copy()
-            string_list_tmp.append("-" + get_variable_for_name(var_tmp, state_tmp))
+    probability_strides = [0] * len(cardinalities)
+    stride = 1
+    for k in range(len(cardinalities) - 1, -1, -1):
+        probability_strides[k] = stride
+        stride *= cardinalities[k]
 
-            string_list_tmp = sorted(string_list_tmp)
+    # The table is in C order, so the position of a CPT line in the flattened table is its key
+    probability_table = np.ascontiguousarray(cpt).reshape(-1)
 
-            key = ""
-            for x in string_list_tmp:
-                key = key + (" " if key else "") + x
 
-            assert key not in probability_dictionary
+def validate_cpt(variables_arg: List[str]) -> None:
+    """
+    Checks the current CPT once, so the functions called for each CPT line do not need to check their arguments
+    :param variables_arg: the parents followed by the variable of the CPT
+    """
+    assert len(variables_arg) > 0
+    assert len(variables_arg) == len(cpt_cardinalities)
+    assert len(variables_arg) == len(cpt_variable_indices)
+    assert len(variables_arg) == len(probability_strides)
 
-            probability_dictionary[key] = probability
-    else:
-        assert dimension_arg % len(states) == 0
+    number_of_lines = 1
+    for k, var_tmp in enumerate(variables_arg):
+        assert cpt_cardinalities[k] == len(states_bayesian_network[var_tmp])
+        assert cpt_cardinalities[k] == len(cpt_variable_indices[k])
 
-        dimension_arg /= len(states)
-        dimension_arg = int(dimension_arg)
+        number_of_lines *= cpt_cardinalities[k]
 
-        for k, state_tmp in enumerate(states):
-            string_list_tmp = string_list_arg.copy()
-            string_list_tmp.append("-" + get_variable_for_name(var_tmp, state_tmp))
+    assert len(probability_table) == number_of_lines
 
-            create_probability_dictionary(string_list_tmp, variables_arg, n_arg + 1, number_arg + dimension_arg * k, dimension_arg)
+    # The keys of the first and the last CPT line
+    assert create_probability_key([0] * len(variables_arg)) == 0
+    assert create_probability_key([cardinality - 1 for cardinality in cpt_cardinalities]) == number_of_lines - 1
 
 
 def listdir_no_hidden(path):
@@ -549,6 +567,9 @@ def reset():
     global number_of_shrinks
     global number_of_independent_variables
     global saved_clauses
+    global independence_cache
+    global independence_recursion_cache
+    global hard_clause_suffix
 
     variable_counter = 1
     number_of_clauses = 0
@@ -560,6 +581,10 @@ def reset():
     number_of_independent_variables = 0
 
     saved_clauses = set()
+    independence_cache = dict()
+    independence_recursion_cache = dict()
+
+    hard_clause_suffix = None
 
 
 if __name__ == '__main__':
@@ -642,95 +667,92 @@ if __name__ == '__main__':
     print("The Bayesian network has been parsed")
     print()
 
-    probability_dictionary: Dict[str, float] = dict()
-    mapping_from_variable_state_to_variable_index: Dict[str, str] = dict()
+    # variable -> the variable indices (str) of its states (in the same order as the states)
+    mapping_from_variable_to_variable_indices: Dict[str, List[str]] = dict()
 
-    with open(TMP_FILE_PATH, "w", encoding="utf-8") as tmp_file:
-        variables_bayesian_network = bayesian_network.get_variables()
-        states_bayesian_network = bayesian_network.get_states()
-        values_bayesian_network = bayesian_network.get_values()
+    # The clauses are kept in memory, since the header (p cnf) must precede them
+    clause_buffer = io.StringIO()
 
-        assert len(variables_bayesian_network) > 0
+    variables_bayesian_network = bayesian_network.get_variables()
+    states_bayesian_network = bayesian_network.get_states()
+    values_bayesian_network = bayesian_network.get_values()
 
-        for variable in variables_bayesian_network:
-            for state in states_bayesian_network[variable]:
-                mapping_from_variable_state_to_variable_index[get_name_for_mapping(variable, state)] = str(get_new_variable_index())
+    assert len(variables_bayesian_network) > 0
 
-        first_selector_variable = variable_counter
-        if selector_variable_type == SelectorVariableTypeEnum.ONE:
-            get_new_variable_index()
+    for variable in variables_bayesian_network:
+        mapping_from_variable_to_variable_indices[variable] = [str(get_new_variable_index()) for _ in states_bayesian_network[variable]]
 
-        # Leaf variables
-        leaf_variables: Set[str] = set()
-        if not constraint_clauses_for_leaf_variables:
-            for variable in variables_bayesian_network:
-                leaf_variable: bool = True
+    first_selector_variable = variable_counter
+    if selector_variable_type == SelectorVariableTypeEnum.ONE:
+        get_new_variable_index()
 
-                for edge in bayesian_network.get_edges():
-                    assert (len(edge) == 2)
+    if selector_variable_type != SelectorVariableTypeEnum.NEW:
+        hard_clause_suffix = get_selector_variable_for_hard_clauses()
 
-                    if edge[0] == variable:
-                        leaf_variable = False
-                        break
+    # Leaf variables
+    leaf_variables: Set[str] = set()
+    if not constraint_clauses_for_leaf_variables:
+        # Variables with an outgoing edge
+        non_leaf_variables: Set[str] = set()
+        for edge in bayesian_network.get_edges():
+            assert (len(edge) == 2)
 
-                if leaf_variable:
-                    leaf_variables.add(variable)
+            non_leaf_variables.add(edge[0])
 
-        # Indicator/constraint clauses
-        for variable in variables_bayesian_network:
-            # Leaf variable
-            if variable in leaf_variables:
-                continue
+        leaf_variables = set(variables_bayesian_network) - non_leaf_variables
 
-            # Constraint clause
-            for state in states_bayesian_network[variable]:
-                tmp_file.write(get_variable_for_name(variable, state) + " ")
+    # Indicator/constraint clauses
+    for variable in variables_bayesian_network:
+        # Leaf variable
+        if variable in leaf_variables:
+            continue
 
-            tmp_file.write(get_selector_variable_for_hard_clauses())
-            number_of_clauses += 1
+        variable_indices = mapping_from_variable_to_variable_indices[variable]
 
-            # Indicator clauses
-            if indicator_clauses:
-                number_of_states = len(states_bayesian_network[variable])
+        # Constraint clause
+        clause_buffer.write("".join(variable_index + " " for variable_index in variable_indices) + (hard_clause_suffix or get_selector_variable_for_hard_clauses()))
+        number_of_clauses += 1
 
-                assert number_of_states > 1
+        # Indicator clauses
+        if indicator_clauses:
+            assert len(variable_indices) > 1
 
-                for i in range(number_of_states - 1):
-                    for j in range(i + 1, number_of_states):
-                        state_i = states_bayesian_network[variable][i]
-                        state_j = states_bayesian_network[variable][j]
+            # All pairs of states are written at once
+            indicator_clause_list: List[str] = ["-" + variable_index_i + " -" + variable_index_j + " " + (hard_clause_suffix or get_selector_variable_for_hard_clauses())
+                                                for variable_index_i, variable_index_j in itertools.combinations(variable_indices, 2)]
 
-                        tmp_file.write("-" + get_variable_for_name(variable, state_i) + " -" + get_variable_for_name(variable, state_j) + " " +
-                                       get_selector_variable_for_hard_clauses())
-                        number_of_clauses += 1
+            clause_buffer.write("".join(indicator_clause_list))
+            number_of_clauses += len(indicator_clause_list)
 
-        # Parameter clauses
-        for i, variable in enumerate(variables_bayesian_network):
-            print("CPT: " + variable)
-            table = bayesian_network.get_parents()[variable].copy()
+    # Parameter clauses
+    for i, variable in enumerate(variables_bayesian_network):
+        print("CPT: " + variable)
+        table = bayesian_network.get_parents()[variable].copy()
 
-            dimension = 1
-            for tmp in table:
-                dimension *= len(states_bayesian_network[tmp])
+        dimension = 1
+        for tmp in table:
+            dimension *= len(states_bayesian_network[tmp])
 
-            dimension_copy = dimension * len(states_bayesian_network[variable])
+        dimension *= len(states_bayesian_network[variable])
 
-            table.append(variable)
+        table.append(variable)
 
-            assert len(table) > 0
+        assert len(table) > 0
 
-            saved_clauses.clear()
-            probability_dictionary.clear()
+        saved_clauses.clear()
+        independence_cache.clear()
+        independence_recursion_cache.clear()
 
-            create_probability_dictionary([], table, 0, 0, dimension)
+        create_probability_table(table)
+        validate_cpt(table)
 
-            assert len(probability_dictionary) == dimension_copy
+        assert len(probability_table) == dimension
 
-            # print(probability_dictionary)
+        # print(probability_table)
 
-            create_parameter_clauses([], table, 0)
+        create_parameter_clauses(table)
 
-            print(str(i + 1) + "/" + str(len(variables_bayesian_network)))
+        print(str(i + 1) + "/" + str(len(variables_bayesian_network)))
 
     print()
     print("Number of ones: " + str(number_of_ones))
@@ -745,85 +767,84 @@ if __name__ == '__main__':
         print(leaf_variable, end=" ")
     print()
 
-    with open(TMP_FILE_PATH, 'r', encoding="utf-8") as tmp_file:
-        with open(output_file_path, 'w', encoding="utf-8") as output_file:
-            # Name
-            if evidence:
-                output_file.write("c " + bayesian_network.get_network_name() + "_e_" + str(seed) + "\n")
-            else:
-                output_file.write("c " + bayesian_network.get_network_name() + "\n")
+    with open(output_file_path, "w", encoding="utf-8") as output_file:
+        # Name
+        if evidence:
+            output_file.write("c " + bayesian_network.get_network_name() + "_e_" + str(seed) + "\n")
+        else:
+            output_file.write("c " + bayesian_network.get_network_name() + "\n")
+        output_file.write("c\n")
+
+        # c r originUrl/doi descUrl/doi [generatorUrl/doi]
+        if model_competition:
+            origin_url = "https://github.com/Illner/Bels"
+            desc_url = "https://github.com/Illner/Bels"
+            output_file.write(f"c r {origin_url} {desc_url}\n")
             output_file.write("c\n")
 
-            # c r originUrl/doi descUrl/doi [generatorUrl/doi]
-            if model_competition:
-                origin_url = "https://github.com/Illner/Bels"
-                desc_url = "https://github.com/Illner/Bels"
-                output_file.write(f"c r {origin_url} {desc_url}\n")
-                output_file.write("c\n")
-
-            # Parameters
-            # output_file.write("c Parameters:\n")
-            # if determinism:
-            #     output_file.write("c \tdeterminism\n")
-            # if add_minor_clauses:
-            #     output_file.write("c \tminor clauses\n")
-            # if indicator_clauses:
-            #     output_file.write("c \tindicator clauses\n")
-            # if context_specific_independence:
-            #     output_file.write("c \tcontext-specific independence\n")
-            # if constraint_clauses_for_leaf_variables:
-            #     output_file.write("c \tconstraint clauses for leaf variables\n")
-            # output_file.write("c \tselector variable type: " + selector_variable_type.name + "\n")
-            # output_file.write("c\n")
-
-            # for variable in variables_bayesian_network:
-            #     output_file.write("c " + variable + "\n")
-            #     for state in states_bayesian_network[variable]:
-            #         output_file.write("c \t" + state + ": " + get_variable_for_name(variable, state) + "\n")
-
-            output_file.write("c selector variables: " + str(first_selector_variable) + ", ...\n")
+        # Parameters
+        # output_file.write("c Parameters:\n")
+        # if determinism:
+        #     output_file.write("c \tdeterminism\n")
+        # if add_minor_clauses:
+        #     output_file.write("c \tminor clauses\n")
+        # if indicator_clauses:
+        #     output_file.write("c \tindicator clauses\n")
+        # if context_specific_independence:
+        #     output_file.write("c \tcontext-specific independence\n")
+        # if constraint_clauses_for_leaf_variables:
+        #     output_file.write("c \tconstraint clauses for leaf variables\n")
+        # output_file.write("c \tselector variable type: " + selector_variable_type.name + "\n")
+        # output_file.write("c\n")
+
+        # for variable in variables_bayesian_network:
+        #     output_file.write("c " + variable + "\n")
+        #     for k, state in enumerate(states_bayesian_network[variable]):
+        #         output_file.write("c \t" + state + ": " + mapping_from_variable_to_variable_indices[variable][k] + "\n")
+
+        output_file.write("c selector variables: " + str(first_selector_variable) + ", ...\n")
+        output_file.write("c\n")
+
+        number_of_clauses_tmp = number_of_clauses
+        if evidence:
+            number_of_clauses_tmp += 1
+
+        output_file.write("p cnf " + str(number_of_variables) + " " + str(number_of_clauses_tmp) + "\n")
+
+        if model_competition:
+            # Header
+            output_file.write("c t wmc\n")
             output_file.write("c\n")
 
-            number_of_clauses_tmp = number_of_clauses
-            if evidence:
-                number_of_clauses_tmp += 1
-
-            output_file.write("p cnf " + str(number_of_variables) + " " + str(number_of_clauses_tmp) + "\n")
-
-            if model_competition:
-                # Header
-                output_file.write("c t wmc\n")
-                output_file.write("c\n")
-
-                # Projection
-                # output_file.write("c p show")
-                # for var in range(1, number_of_variables + 1):
-                #     output_file.write(" " + str(var))
-                # output_file.write(" 0 \n")
+            # Projection
+            # output_file.write("c p show")
+            # for var in range(1, number_of_variables + 1):
+            #     output_file.write(" " + str(var))
+            # output_file.write(" 0 \n")
 
-                # Indicator variable weights
-                output_file.write("c Indicator variable weights:\n")
-                for var_id in range(1, first_selector_variable):
-                    output_file.write(f"c p weight {var_id} 1 0\n")
-                    output_file.write(f"c p weight -{var_id} 1 0\n")
+            # Indicator variable weights
+            output_file.write("c Indicator variable weights:\n")
+            for var_id in range(1, first_selector_variable):
+                output_file.write(f"c p weight {var_id} 1 0\n")
+                output_file.write(f"c p weight -{var_id} 1 0\n")
 
-            output_file.write(tmp_file.read())
+        output_file.write(clause_buffer.getvalue())
 
-            # Generate and set evidence
-            if evidence:
-                disease_variables = [v for v in variables_bayesian_network if v.startswith("Disease")]
+        # Generate and set evidence
+        if evidence:
+            disease_variables = [v for v in variables_bayesian_network if v.startswith("Disease")]
 
-                if not disease_variables:
-                    raise Exception("The BN must be generated by \"Generate.py\"")
+            if not disease_variables:
+                raise Exception("The BN must be generated by \"Generate.py\"")
 
-                chosen_symptom = random.choice(disease_variables)
-                chosen_state = random.choice(states_bayesian_network[chosen_symptom])
+            chosen_symptom = random.choice(disease_variables)
+            chosen_state = random.choice(states_bayesian_network[chosen_symptom])
 
-                cnf_var_index = mapping_from_variable_state_to_variable_index[get_name_for_mapping(chosen_symptom, chosen_state)]
+            cnf_var_index = mapping_from_variable_to_variable_indices[chosen_symptom][states_bayesian_network[chosen_symptom].index(chosen_state)]
 
-                # output_file.write(f"c Evidence: {chosen_symptom} = {chosen_state}\n")
-                output_file.write(f"c evidence\n")
-                output_file.write(f"{cnf_var_index} 0\n")
+            # output_file.write(f"c Evidence: {chosen_symptom} = {chosen_state}\n")
+            output_file.write(f"c evidence\n")
+            output_file.write(f"{cnf_var_index} 0\n")
 
-    os.remove(TMP_FILE_PATH)
+    clause_buffer.close()
     reset()
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import random
 import argparse
+import itertools
 from pathlib import Path
-from typing import List, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Union
+
+
+OUTPUT_FILE_BUFFER_SIZE: int = 1 << 20  # 1 MiB
 
 
 def positive_int_or_none_parser(value: Union[int, str], percentage: bool, at_least_two: bool) -> Union[int, None]:
@@ -55,12 +61,20 @@ def percentage_parser(value: Union[int, str]) -> int:
     return positive_int_or_none_parser(value, True, False)
 
 
+def positive_int_parser(value: Union[int, str]) -> int:
+    # None
+    if isinstance(value, str) and value.lower() == "none":
+        raise argparse.ArgumentTypeError(f"\"{value}\" has an invalid type ({type(value)}); int is expected!")
+
+    return positive_int_or_none_parser(value, False, False)
+
+
 def output_file_path_parser(path: str) -> str:
     """
-    Try to create an empty output file
+    Check if the output file does not exist and can be created (the file itself is not created)
     :param path: the path of the output file
     :return: the path
-    :raises ArgumentTypeError: if the output file creation fails or the output file already exists
+    :raises ArgumentTypeError: if the output file already exists or cannot be created
     """
 
     if not path.endswith(".bif"):
@@ -72,18 +86,17 @@ def output_file_path_parser(path: str) -> str:
     if path_tmp.exists():
         raise argparse.ArgumentTypeError(f"The output file ({path}) already exists. Please delete it or choose another name for the output file!")
 
-    try:
-        with open(path_tmp, "w", encoding="utf-8") as _:
-            pass
-    except Exception as err:
-        raise argparse.ArgumentTypeError(f"An error occurred while creating the output file ({path})! ({str(err)})")
+    directory_tmp = path_tmp.parent
 
-    # Check if the output file has been created
-    if path_tmp.exists():
-        path_tmp.unlink()
-        return path
+    # The directory of the output file does not exist
+    if not directory_tmp.is_dir():
+        raise argparse.ArgumentTypeError(f"The directory of the output file ({path}) doesn't exist!")
+
+    # The directory of the output file is not writable
+    if not os.access(directory_tmp, os.W_OK):
+        raise argparse.ArgumentTypeError(f"The output file ({path}) cannot be created, since its directory is not writable!")
 
-    raise argparse.ArgumentTypeError(f"An error occurred while creating the output file ({path})!")
+    return path
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -145,6 +158,15 @@ def create_parser() -> argparse.ArgumentParser:
                             default=False,
                             help="if set, nontrivial random probabilities will be generated; otherwise, deterministic (1.0/0.0) probabilities will be used")
 
+    parser_tmp.add_argument("-p",
+                            "--processes",
+                            action="store",
+                            default=1,
+                            type=positive_int_parser,
+                            metavar="[positive number]",
+                            help="number of processes building the CPTs of the symptoms (ignored if the probabilities are generated, "
+                                 "since they are drawn one after another from the seeded random generator)")
+
     return parser_tmp
 
 
@@ -169,8 +191,6 @@ def create_disease_name(position: int) -> str:
     """
     :return: the disease name
     """
-    assert (position >= 0)
-    assert (position < len(diseases))
 
     return "Disease_" + str(position + 1)
 
@@ -179,10 +199,6 @@ def create_disease_value(position_1: int, position_2: int) -> str:
     """
     :return: the disease value
     """
-    assert (position_1 >= 0)
-    assert (position_2 >= 0)
-    assert (position_1 < len(diseases))
-    assert (position_2 < diseases[position_1])
 
     return "value_d_" + str(position_1 + 1) + "_" + str(position_2 + 1)
 
@@ -191,8 +207,6 @@ def create_symptom_name(position: int) -> str:
     """
     :return: the symptom name
     """
-    assert (position >= 0)
-    assert (position < len(symptoms))
 
     return "Symptom_" + str(position + 1)
 
@@ -201,10 +215,6 @@ def create_symptom_value(position_1: int, position_2: int) -> str:
     """
     :return: the symptom value
     """
-    assert (position_1 >= 0)
-    assert (position_2 >= 0)
-    assert (position_1 < len(symptoms))
-    assert (position_2 < symptoms[position_1])
 
     return "value_s_" + str(position_1 + 1) + "_" + str(position_2 + 1)
 
@@ -222,7 +232,7 @@ def generate_probability_distribution(size: int) -> List[float]:
         min_p = 1.0 / (size * 10.0)
 
     remaining_space = 1.0 - (size * min_p)
-    raw_weights = [random.random() for _ in range(size)]
+    raw_weights = [rng.random() for _ in range(size)]
     total_weight = sum(raw_weights)
 
     # Scale weights to fill the remaining space and add the floor
@@ -247,15 +257,16 @@ def create_disease_probability(position: int) -> str:
         probs = generate_probability_distribution(max_position)
         formatted_probs = [f"{p:.3f}" for p in probs]
 
+        tmp += " " + ", ".join(formatted_probs) + ";"
+
     # Deterministic probabilities
     else:
-        formatted_probs = ["1.0" if v == 0 else "0.0" for v in range(max_position)]
+        tmp += deterministic_disease_row
 
-    tmp += " " + ", ".join(formatted_probs) + ";"
     return tmp
 
 
-def create_symptom_probability(position, positions: List[int]) -> str:
+def create_symptom_probability(position, positions: List[int]) -> bytes:
     assert (position >= 0)
     assert (position < len(symptoms))
     assert (len(positions) >= 2)
@@ -263,44 +274,75 @@ def create_symptom_probability(position, positions: List[int]) -> str:
         assert (p >= 0)
         assert (p < len(diseases))
 
-    values: List[int] = []
-    for _ in range(len(positions)):
-        values.append(0)
+    max_position = symptoms[position]
 
-    tmp: str = create_symptom_probability_recursion(position, positions, 0, values, "")
+    # The values of the parents
+    parent_values: List[List[str]] = [disease_values[p] for p in positions]
 
-    return tmp
+    # The CPT lines (all combinations of the values of the parents)
+    lines = map(", ".join, itertools.product(*parent_values))
 
+    # Generate probabilities (each CPT line is encoded and appended to a single buffer)
+    if generate_probabilities:
+        out: bytearray = bytearray()
+        for line in lines:
+            probs = generate_probability_distribution(max_position)
+            formatted_probs = [f"{p:.3f}" for p in probs]
 
-def create_symptom_probability_recursion(position, positions: List[int], current_position: int, values: List[int], string: str) -> str:
-    # Base case
-    if current_position == len(positions):
-        string += "  ("
-        for k, value in enumerate(values):
-            string += create_disease_value(positions[k], value)
-            if k < len(values) - 1:
-                string += ", "
-        string += ")"
+            out += ("  (" + line + ") " + ", ".join(formatted_probs) + ";\n").encode("ascii")
 
-        max_position = symptoms[position]
+        return bytes(out)
 
-        # Generate probabilities
-        if generate_probabilities:
-            probs = generate_probability_distribution(max_position)
-            formatted_probs = [f"{p:.3f}" for p in probs]
+    # Deterministic probabilities (the same for all CPT lines => the lines are joined at once)
+    return ("  (" + (")" + deterministic_symptom_row + "  (").join(lines) + ")" + deterministic_symptom_row).encode("ascii")
 
-        # Deterministic probabilities
-        else:
-            formatted_probs = ["1.0" if k == 0 else "0.0" for k in range(max_position)]
 
-        string += " " + ", ".join(formatted_probs) + ";\n"
-        return string
+def create_symptom_block(position: int, positions: List[int]) -> bytes:
+    """
+    :param position: the symptom
+    :param positions: the (sorted) parents of the symptom
+    :return: the encoded probability block (CPT) of the symptom
+    """
+
+    parent_names: str = ", ".join([disease_names[p] for p in positions])
+
+    return (("probability ( " + symptom_names[position] + " | " + parent_names + " ) {\n").encode("ascii") +
+            create_symptom_probability(position, positions) +
+            b"}\n")
 
-    for v in range(diseases[positions[current_position]]):
-        values[current_position] = v
-        string = create_symptom_probability_recursion(position, positions, current_position + 1, values, string)
 
-    return string
+def initialize_symptom_worker(diseases_arg: List[int], symptoms_arg: List[int],
+                              disease_names_arg: List[str], disease_values_arg: List[List[str]],
+                              symptom_names_arg: List[str], deterministic_symptom_row_arg: str) -> None:
+    """
+    Set the globals needed by create_symptom_block in a worker process (the main block is not run there)
+    """
+
+    global diseases, symptoms, disease_names, disease_values, symptom_names, deterministic_symptom_row, generate_probabilities
+
+    diseases = diseases_arg
+    symptoms = symptoms_arg
+    disease_names = disease_names_arg
+    disease_values = disease_values_arg
+    symptom_names = symptom_names_arg
+    deterministic_symptom_row = deterministic_symptom_row_arg
+    generate_probabilities = False
+
+
+def write_symptom_blocks(file_arg, blocks_arg: Iterable[bytes], number_of_symptoms_arg: int) -> None:
+    """
+    Write the probability blocks of the symptoms (in the given order) and show the progress
+    """
+
+    progress_step: int = max(1, number_of_symptoms_arg // 100)     # the progress is shown (at most) 100 times
+    for i, block in enumerate(blocks_arg):
+        if (i + 1) % progress_step == 0 or i + 1 == number_of_symptoms_arg:
+            sys.stderr.write(f"\r{i + 1}/{number_of_symptoms_arg}")
+            sys.stderr.flush()
+
+        file_arg.write(block)
+
+    sys.stderr.write("\n")
 
 
 def print_title() -> None:
@@ -332,7 +374,7 @@ if __name__ == '__main__':
         seed: int = args.seed
     density: int = args.density
 
-    random.seed(seed)
+    rng: random.Random = random.Random(seed)
     randomness: bool = (density != 100)
     number_of_edges: int = int(number_of_diseases * (density / 100))
 
@@ -341,19 +383,19 @@ if __name__ == '__main__':
 
     path: str = args.output_file
     generate_probabilities: bool = args.generate_probabilities
+    processes: int = args.processes
 
     # Print arguments
-    print("Arguments:")
-    print("\toutput file: " + path)
-    print("\ttop layer size: " + str(number_of_diseases))
-    print("\tbottom layer size: " + str(number_of_symptoms))
-    print("\tdomain size: " + str(diseases_domain_size))
-    print("\tdensity: " + str(density) + "%")
-    if randomness:
-        print("\tseed: " + str(seed))
-    print("\tgenerate probabilities: " + str(generate_probabilities))
-    print("Number of edges: " + str(number_of_edges))
-    print()
+    seed_line: str = f"\tseed: {seed}\n" if randomness else ""
+    print(f"""Arguments:
+\toutput file: {path}
+\ttop layer size: {number_of_diseases}
+\tbottom layer size: {number_of_symptoms}
+\tdomain size: {diseases_domain_size}
+\tdensity: {density}%
+{seed_line}\tgenerate probabilities: {generate_probabilities}
+Number of edges: {number_of_edges}
+""")
 
     assert (number_of_edges >= 2)
     assert (diseases_domain_size >= 2)
@@ -371,52 +413,57 @@ if __name__ == '__main__':
     for i in range(number_of_symptoms):
         symptoms.append(symptoms_domain_size)
 
-    with open(path, "w", encoding="utf-8") as file:
-        file.write("network " + get_bayesian_network_name() + " {}\n")
+    # Names and values
+    disease_names: List[str] = [create_disease_name(i) for i in range(number_of_diseases)]
+    disease_values: List[List[str]] = [[create_disease_value(i, j) for j in range(diseases[i])] for i in range(number_of_diseases)]
+    symptom_names: List[str] = [create_symptom_name(i) for i in range(number_of_symptoms)]
+    symptom_values: List[List[str]] = [[create_symptom_value(i, j) for j in range(symptoms[i])] for i in range(number_of_symptoms)]
+
+    # Deterministic probabilities (the same for all CPT lines, since the domain size is fixed)
+    deterministic_disease_row: str = " 1.0" + ", 0.0" * (diseases_domain_size - 1) + ";"
+    deterministic_symptom_row: str = " 1.0" + ", 0.0" * (symptoms_domain_size - 1) + ";\n"
+
+    with open(path, "wb", buffering=OUTPUT_FILE_BUFFER_SIZE) as file:
+        # The variables and the CPTs of the diseases are built in memory and written at once
+        parts: List[str] = []
+
+        parts.append("network " + get_bayesian_network_name() + " {}\n")
 
         # Diseases - variables
         for i, number_of_parameters in enumerate(diseases):
-            file.write("variable " + create_disease_name(i) + " {\n")
-            file.write("  type discrete [ " + str(number_of_parameters) + " ] { ")
-            for j in range(number_of_parameters):
-                file.write(create_disease_value(i, j))
-                if j != number_of_parameters - 1:
-                    file.write(", ")
-                else:
-                    file.write(" ")
-            file.write("};\n")
-            file.write("}\n")
+            parts.append(f"variable {disease_names[i]} {{\n  type discrete [ {number_of_parameters} ] {{ {', '.join(disease_values[i])} }};\n}}\n")
 
         # Symptoms - variables
         for i, number_of_parameters in enumerate(symptoms):
-            file.write("variable " + create_symptom_name(i) + " {\n")
-            file.write("  type discrete [ " + str(number_of_parameters) + " ] { ")
-            for j in range(number_of_parameters):
-                file.write(create_symptom_value(i, j))
-                if j != number_of_parameters - 1:
-                    file.write(", ")
-                else:
-                    file.write(" ")
-            file.write("};\n")
-            file.write("}\n")
+            parts.append(f"variable {symptom_names[i]} {{\n  type discrete [ {number_of_parameters} ] {{ {', '.join(symptom_values[i])} }};\n}}\n")
 
         # Diseases - probabilities
         for i in range(number_of_diseases):
-            file.write("probability ( " + create_disease_name(i) + " ) {\n")
-            file.write("  " + create_disease_probability(i) + "\n")
-            file.write("}\n")
-
-        # Symptoms - probabilities
-        for i in range(number_of_symptoms):
-            print(str(i + 1) + "/" + str(number_of_symptoms))
-            edges: List[int] = random.sample(range(0, number_of_diseases), number_of_edges)
-            edges.sort()
-            file.write("probability ( " + create_symptom_name(i) + " |")
-            for j, edge in enumerate(edges):
-                if j == 0:
-                    file.write(" " + create_disease_name(edge))
-                else:
-                    file.write(", " + create_disease_name(edge))
-            file.write(" ) {\n")
-            file.write(create_symptom_probability(i, edges))
-            file.write("}\n")
+            parts.append("probability ( " + disease_names[i] + " ) {\n")
+            parts.append("  " + create_disease_probability(i) + "\n")
+            parts.append("}\n")
+
+        file.write("".join(parts).encode("ascii"))
+
+        # Symptoms - probabilities (each CPT is written as soon as it is built)
+        diseases_indices: range = range(number_of_diseases)
+        # Fully dense BN => every disease is a parent of every symptom (no sampling is needed)
+        fixed_edges: List[int] = [] if randomness else list(diseases_indices)
+        # The parents are sampled using the random module (seeded by the seed) on purpose,
+        # so the same seed always generates the same BN (e.g., the BNs in README).
+        # The parents are sampled lazily, one symptom after another, since with generated probabilities
+        # the parents and the probabilities of the symptoms are drawn alternately from the same random generator
+        symptom_edges = (sorted(rng.sample(diseases_indices, number_of_edges)) if randomness else fixed_edges
+                         for _ in range(number_of_symptoms))
+
+        # The CPTs are built in parallel (the parents are still sampled in this process, in the same order)
+        if processes > 1 and not generate_probabilities:
+            with ProcessPoolExecutor(max_workers=processes,
+                                     initializer=initialize_symptom_worker,
+                                     initargs=(diseases, symptoms, disease_names, disease_values, symptom_names, deterministic_symptom_row)) as executor:
+                write_symptom_blocks(file,
+                                     executor.map(create_symptom_block, range(number_of_symptoms), symptom_edges,
+                                                  chunksize=max(1, number_of_symptoms // (4 * processes))),
+                                     number_of_symptoms)
+        else:
+            write_symptom_blocks(file, map(create_symptom_block, range(number_of_symptoms), symptom_edges), number_of_symptoms)